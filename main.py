@@ -1,21 +1,64 @@
+import asyncio
+import copy
+import logging
 import os
+import re
 import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional, Union
-
-from pydantic import BaseModel
-from database import db, create_document, get_documents
+from fastapi.responses import ORJSONResponse
+from typing import List, Literal, Optional, Union
+
+from bson import ObjectId
+from cachetools import TTLCache
+from pydantic import BaseModel, ConfigDict
+from pymongo import ReturnDocument, UpdateOne
+from database import db, create_document
 from schemas import Property
 
-app = FastAPI(title="Loved Homes API")
+logger = logging.getLogger("uvicorn.error")
+
+
+async def ensure_indexes():
+    try:
+        # Keeps list queries off a collection scan once they sort by recency
+        await db["property"].create_index([("updated_at", -1)])
+    except Exception as e:
+        logger.warning("Could not create property indexes: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in the background so an unreachable database can't hold up startup
+    index_task = asyncio.create_task(ensure_indexes()) if db is not None else None
+    yield
+    if index_task is not None:
+        index_task.cancel()
+
+
+app = FastAPI(title="Loved Homes API", lifespan=lifespan)
+
+_OID_RE = re.compile(r"[0-9a-fA-F]{24}")
+
+# Short-lived cache of property documents keyed by id; writes from this process evict their entry
+property_cache = TTLCache(maxsize=1024, ttl=2.0)
+# Bumped on every property write so a cache fill that raced a write doesn't store the old document
+property_writes = 0
+# /test is hit by health probes; listCollections is an admin command, so reuse a healthy result
+status_cache = TTLCache(maxsize=1, ttl=30)
+
+# Comma-separated list, e.g. CORS_ORIGINS=https://app.example.com,http://localhost:3000
+cors_origins = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=cors_origins or ["*"],
+    # Without an explicit list any origin is allowed, so credentialed requests must opt in via CORS_ORIGINS
+    allow_credentials=bool(cors_origins),
+    allow_methods=["GET", "POST", "PATCH", "DELETE"],
+    allow_headers=["Content-Type", "Authorization"],
 )
 
 
@@ -30,40 +73,64 @@ def to_public(doc):
     return d
 
 
+def to_object_id(prop_id: str):
+    # Reject malformed ids up front instead of paying for ObjectId's exception path
+    if not _OID_RE.fullmatch(prop_id):
+        raise HTTPException(status_code=400, detail="Invalid property id")
+    return ObjectId(prop_id)
+
+
 def parse_path(path_param: Optional[Union[str, List[int]]]) -> List[int]:
-    if path_param is None:
+    if not path_param:
         return []
     if isinstance(path_param, list):
-        return [int(x) for x in path_param]
+        return list(map(int, path_param))
     if isinstance(path_param, str):
-        if path_param.strip() == "":
+        path_param = path_param.strip()
+        if not path_param:
             return []
-        return [int(x) for x in path_param.split(',') if x.strip() != ""]
+        return [int(x) for x in path_param.split(',') if x.strip()]
     return []
 
 
 # Pydantic request models
 class PropertyCreate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     name: str
     photo_url: Optional[str] = None
 
 
 class PropertyUpdate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     name: Optional[str] = None
     photo_url: Optional[str] = None
 
 
 class NodeCreate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     title: str
     kind: str = "item"  # "item" or "folder"
     parent_path: List[int] = []  # path of indices to reach parent (e.g., [0,2])
 
 
 class NodeUpdate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     title: Optional[str] = None
     kind: Optional[str] = None
 
 
+class BatchOp(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    op: Literal["add", "update", "delete"]
+    path: List[int] = []  # parent path for "add", node path for "update"/"delete"
+    payload: Optional[NodeUpdate] = None
+
+
 # Routes
 @app.get("/")
 def read_root():
@@ -71,7 +138,11 @@ def read_root():
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
+    cached = status_cache.get("status")
+    if cached is not None:
+        return cached
+
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -87,9 +158,11 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
+                # Only a healthy result is reused, so recovery shows up on the next probe
+                status_cache["status"] = response
             except Exception as e:
                 response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
         else:
@@ -100,57 +173,65 @@ def test_database():
 
 
 # Properties CRUD
-@app.get("/api/properties")
-async def list_properties():
-    docs = get_documents("property")
-    return [to_public(d) for d in docs]
+@app.get("/api/properties", response_class=ORJSONResponse)
+async def list_properties(include_checklist: bool = True):
+    # List views can skip the checklist arrays, which dominate document size
+    projection = None if include_checklist else {"checklist": 0}
+    # Returned directly so orjson does the encoding instead of FastAPI's jsonable_encoder
+    return ORJSONResponse([to_public(d) async for d in db["property"].find({}, projection=projection)])
 
 
 @app.post("/api/properties", response_model=dict)
 async def create_property(payload: PropertyCreate):
     prop = Property(name=payload.name, photo_url=payload.photo_url, checklist=[])
-    new_id = create_document("property", prop)
+    new_id = await create_document("property", prop)
     return {"id": new_id}
 
 
 @app.patch("/api/properties/{prop_id}")
 async def update_property(prop_id: str, payload: PropertyUpdate):
-    from bson import ObjectId
-    try:
-        oid = ObjectId(prop_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid property id")
+    oid = to_object_id(prop_id)
 
-    updates = {k: v for k, v in payload.model_dump(exclude_none=True).items()}
+    # PATCH semantics: only the fields the client actually sent
+    updates = payload.model_dump(exclude_unset=True)
+    if updates.get("name") is None:
+        updates.pop("name", None)  # name is required, so an explicit null is ignored
     if not updates:
         return {"updated": False}
-    updates["updated_at"] = __import__("datetime").datetime.utcnow()
-    res = db["property"].update_one({"_id": oid}, {"$set": updates})
+    updates["updated_at"] = datetime.utcnow()
+    res = await db["property"].update_one({"_id": oid}, {"$set": updates})
+    evict_property(oid)
     return {"updated": res.modified_count == 1}
 
 
 @app.delete("/api/properties/{prop_id}")
 async def delete_property(prop_id: str):
-    from bson import ObjectId
-    try:
-        oid = ObjectId(prop_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid property id")
-    res = db["property"].delete_one({"_id": oid})
+    oid = to_object_id(prop_id)
+    res = await db["property"].delete_one({"_id": oid})
+    evict_property(oid)
     return {"deleted": res.deleted_count == 1}
 
 
 # Checklist tree helpers
 
-def get_property_or_404(prop_id: str):
-    from bson import ObjectId
-    try:
-        oid = ObjectId(prop_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid property id")
-    doc = db["property"].find_one({"_id": oid})
+def evict_property(oid):
+    global property_writes
+    property_writes += 1
+    property_cache.pop(str(oid), None)
+
+
+async def get_property_or_404(prop_id: str):
+    # Only the checklist endpoint reads properties back, so fetch and cache just that field
+    oid = to_object_id(prop_id)
+    doc = property_cache.get(str(oid))
+    if doc is not None:
+        return doc
+    writes_before = property_writes
+    doc = await db["property"].find_one({"_id": oid}, projection={"checklist": 1})
     if not doc:
         raise HTTPException(status_code=404, detail="Property not found")
+    if property_writes == writes_before:
+        property_cache[str(oid)] = doc
     return doc
 
 
@@ -165,45 +246,89 @@ def get_node_by_path(checklist: list, path: List[int]):
     return parent, node_list
 
 
-@app.get("/api/properties/{prop_id}/checklist")
-async def get_checklist(prop_id: str):
-    doc = get_property_or_404(prop_id)
-    return to_public(doc).get("checklist", [])
+def path_to_dotted(prefix: str, path: List[int]) -> str:
+    """Translate an index path into a dotted field, e.g. [0, 2] -> checklist.0.children.2"""
+    parts = [prefix]
+    for depth, idx in enumerate(path):
+        if idx < 0:
+            raise HTTPException(status_code=400, detail="Path out of range")
+        if depth:
+            parts.append("children")
+        parts.append(str(idx))
+    return ".".join(parts)
 
 
-@app.post("/api/properties/{prop_id}/checklist")
-async def add_node(prop_id: str, payload: NodeCreate):
-    doc = get_property_or_404(prop_id)
-    checklist = doc.get("checklist", [])
+async def raise_missing_target(oid, detail: str):
+    # The filtered update matched nothing: either the property or the node is missing
+    if await db["property"].find_one({"_id": oid}, projection={"_id": 1}) is None:
+        raise HTTPException(status_code=404, detail="Property not found")
+    raise HTTPException(status_code=400, detail=detail)
+
+
+@app.get("/api/properties/{prop_id}/checklist")
+async def get_checklist(prop_id: str):
+    doc = await get_property_or_404(prop_id)
+    return doc.get("checklist", [])
 
-    parent, _ = get_node_by_path(checklist, payload.parent_path)
 
+# Targets are matched with $type "object" rather than $exists: a deleted slot is null until its
+# $pull lands, and a concurrent edit must not match (or write into) that null
+def build_add_op(parent_path: List[int], title: str, kind: Optional[str]):
     new_node = {
         "id": str(uuid.uuid4()),
-        "title": payload.title,
-        "kind": payload.kind if payload.kind in ("item", "folder") else "item",
+        "title": title,
+        "kind": kind if kind in ("item", "folder") else "item",
     }
     if new_node["kind"] == "folder":
         new_node["children"] = []
 
     # If parent_path points to a node, append into its children, else at root
-    if payload.parent_path:
-        if parent is not None:
-            # Ensure parent is a folder so children are visible in UI
-            if parent.get("kind") != "folder":
-                parent["kind"] = "folder"
-                parent.setdefault("children", [])
+    if parent_path:
+        parent_field = path_to_dotted("checklist", parent_path)
+        # Ensure parent is a folder so children are visible in UI
+        update = {
+            "$set": {f"{parent_field}.kind": "folder"},
+            "$push": {f"{parent_field}.children": new_node},
+        }
+        return {parent_field: {"$type": "object"}}, update, new_node
+    return {}, {"$push": {"checklist": new_node}}, new_node
+
+
+def build_update_op(path_list: List[int], payload: Optional[NodeUpdate]):
+    node_field = path_to_dotted("checklist", path_list)
+    update = {}
+    if payload is not None:
+        if payload.title is not None:
+            update.setdefault("$set", {})[f"{node_field}.title"] = payload.title
+        if payload.kind in ("item", "folder"):
+            update.setdefault("$set", {})[f"{node_field}.kind"] = payload.kind
+            if payload.kind == "folder":
+                # Pushing an empty $each creates children only when it is missing
+                update["$push"] = {f"{node_field}.children": {"$each": []}}
             else:
-                parent.setdefault("children", [])
-            parent["children"].append(new_node)
-        else:
-            raise HTTPException(status_code=400, detail="Parent not found")
-    else:
-        checklist.append(new_node)
+                update["$unset"] = {f"{node_field}.children": ""}
+    return {node_field: {"$type": "object"}}, update
 
-    oid = __import__("bson").ObjectId(prop_id)
-    db["property"].update_one({"_id": oid}, {"$set": {"checklist": checklist}})
-    return {"added": True, "node": new_node, "checklist": checklist}
+
+def build_delete_ops(path_list: List[int]):
+    node_field = path_to_dotted("checklist", path_list)
+    list_field = node_field.rsplit(".", 1)[0]
+    # Arrays can't drop an element by index directly: null the slot, then pull the nulls
+    return {node_field: {"$type": "object"}}, [{"$unset": {node_field: ""}}, {"$pull": {list_field: None}}]
+
+
+@app.post("/api/properties/{prop_id}/checklist")
+async def add_node(prop_id: str, payload: NodeCreate):
+    oid = to_object_id(prop_id)
+    query, update, new_node = build_add_op(payload.parent_path, payload.title, payload.kind)
+
+    doc = await db["property"].find_one_and_update(
+        {"_id": oid, **query}, update, projection={"checklist": 1}, return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        await raise_missing_target(oid, "Path out of range")
+    evict_property(oid)
+    return {"added": True, "node": new_node, "checklist": doc.get("checklist", [])}
 
 
 @app.patch("/api/properties/{prop_id}/checklist")
@@ -212,27 +337,26 @@ async def update_node(prop_id: str, path: Optional[Union[str, List[int]]] = None
     if not path_list:
         raise HTTPException(status_code=400, detail="Path required")
 
-    doc = get_property_or_404(prop_id)
-    checklist = doc.get("checklist", [])
+    oid = to_object_id(prop_id)
+    query, update = build_update_op(path_list, payload)
+    query = {"_id": oid, **query}
 
-    parent, node_list = get_node_by_path(checklist, path_list[:-1]) if path_list else (None, checklist)
-    idx = path_list[-1]
-    if idx < 0 or idx >= len(node_list):
-        raise HTTPException(status_code=400, detail="Index out of range")
+    if update:
+        doc = await db["property"].find_one_and_update(
+            query, update, projection={"checklist": 1}, return_document=ReturnDocument.AFTER
+        )
+    else:
+        doc = await db["property"].find_one(query, projection={"checklist": 1})
+    if doc is None:
+        await raise_missing_target(oid, "Index out of range")
+    evict_property(oid)
 
-    node = node_list[idx]
-    if payload is not None:
-        if payload.title is not None:
-            node["title"] = payload.title
-        if payload.kind in ("item", "folder"):
-            if payload.kind == "folder" and "children" not in node:
-                node["children"] = []
-            if payload.kind == "item" and "children" in node:
-                node.pop("children", None)
-            node["kind"] = payload.kind
-
-    oid = __import__("bson").ObjectId(prop_id)
-    db["property"].update_one({"_id": oid}, {"$set": {"checklist": checklist}})
+    checklist = doc.get("checklist", [])
+    if len(path_list) == 1:
+        node_list = checklist
+    else:
+        _, node_list = get_node_by_path(checklist, path_list[:-1])
+    node = node_list[path_list[-1]]
     return {"updated": True, "node": node, "checklist": checklist}
 
 
@@ -242,19 +366,112 @@ async def delete_node(prop_id: str, path: Optional[Union[str, List[int]]] = None
     if not path_list:
         raise HTTPException(status_code=400, detail="Path required")
 
-    doc = get_property_or_404(prop_id)
+    oid = to_object_id(prop_id)
+    query, (unset, pull) = build_delete_ops(path_list)
+
+    doc = await db["property"].find_one_and_update(
+        {"_id": oid, **query}, unset, projection={"checklist": 1}, return_document=ReturnDocument.BEFORE
+    )
+    if doc is None:
+        await raise_missing_target(oid, "Index out of range")
+    await db["property"].update_one({"_id": oid}, pull)
+    evict_property(oid)
+
     checklist = doc.get("checklist", [])
+    if len(path_list) == 1:
+        node_list = checklist
+    else:
+        _, node_list = get_node_by_path(checklist, path_list[:-1])
+    removed = node_list.pop(path_list[-1])
+    return {"deleted": True, "removed": removed, "checklist": checklist}
+
 
-    parent, node_list = get_node_by_path(checklist, path_list[:-1]) if path_list else (None, checklist)
-    idx = path_list[-1]
+def check_batch_op(checklist: list, op: BatchOp, new_node: Optional[dict] = None):
+    """Replay an op on a local copy of the checklist and return the id of the node it targets"""
+    if op.op == "add":
+        parent, _ = get_node_by_path(checklist, op.path)
+        if parent is None:
+            node_list = checklist
+        else:
+            parent["kind"] = "folder"
+            if parent.get("children") is None:
+                parent["children"] = []
+            node_list = parent["children"]
+        node_list.append(copy.deepcopy(new_node))
+        return parent.get("id") if parent is not None else None
+
+    _, node_list = get_node_by_path(checklist, op.path[:-1])
+    idx = op.path[-1]
     if idx < 0 or idx >= len(node_list):
         raise HTTPException(status_code=400, detail="Index out of range")
+    if op.op == "delete":
+        return node_list.pop(idx).get("id")
 
-    removed = node_list.pop(idx)
-
-    oid = __import__("bson").ObjectId(prop_id)
-    db["property"].update_one({"_id": oid}, {"$set": {"checklist": checklist}})
-    return {"deleted": True, "removed": removed, "checklist": checklist}
+    node = node_list[idx]
+    if op.payload is not None:
+        if op.payload.title is not None:
+            node["title"] = op.payload.title
+        if op.payload.kind == "folder":
+            node.setdefault("children", [])
+            node["kind"] = "folder"
+        elif op.payload.kind == "item":
+            node.pop("children", None)
+            node["kind"] = "item"
+    return node.get("id")
+
+
+def guard_target(query: dict, path: List[int], node_id: Optional[str]):
+    # Pin the write to the node seen during the replay so a shifted index misses instead of editing a neighbour
+    if path:
+        query[f"{path_to_dotted('checklist', path)}.id"] = node_id
+
+
+@app.post("/api/properties/{prop_id}/checklist:batch")
+async def batch_checklist(prop_id: str, ops: List[BatchOp]):
+    oid = to_object_id(prop_id)
+    doc = await db["property"].find_one({"_id": oid}, projection={"checklist": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Property not found")
+    checklist = copy.deepcopy(doc.get("checklist", []))
+
+    # Paths are positional, so each op is checked against the tree left by the previous ones
+    writes = []
+    for i, op in enumerate(ops):
+        try:
+            if op.op == "add":
+                if op.payload is None or op.payload.title is None:
+                    raise HTTPException(status_code=400, detail="Title required")
+                query, update, new_node = build_add_op(op.path, op.payload.title, op.payload.kind)
+                guard_target(query, op.path, check_batch_op(checklist, op, new_node))
+                writes.append(UpdateOne({"_id": oid, **query}, update))
+            elif not op.path:
+                raise HTTPException(status_code=400, detail="Path required")
+            elif op.op == "update":
+                query, update = build_update_op(op.path, op.payload)
+                guard_target(query, op.path, check_batch_op(checklist, op))
+                if update:
+                    writes.append(UpdateOne({"_id": oid, **query}, update))
+            else:
+                query, (unset, pull) = build_delete_ops(op.path)
+                guard_target(query, op.path, check_batch_op(checklist, op))
+                writes.append(UpdateOne({"_id": oid, **query}, unset))
+                writes.append(UpdateOne({"_id": oid}, pull))
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"Op {i}: {e.detail}")
+
+    if writes:
+        res = await db["property"].bulk_write(writes, ordered=True)
+        evict_property(oid)
+        # Every write was checked up front, so a miss means the checklist changed underneath us.
+        # The guarded ops that missed were skipped but the rest were written, so report what is stored.
+        if res.matched_count != len(writes):
+            doc = await db["property"].find_one({"_id": oid}, projection={"checklist": 1}) or {}
+            raise HTTPException(status_code=409, detail={
+                "message": "Checklist changed during batch; only some ops were applied",
+                "checklist": doc.get("checklist", []),
+            })
+
+    return {"applied": len(ops), "checklist": checklist}
 
 
 if __name__ == "__main__":
@@ -10,6 +10,11 @@ from typing import List, Literal, Optional
 
 
 class ChecklistNode(BaseModel):
+    """
+    Embedded in Property.checklist and addressed by index path (e.g. [0, 2]).
+    Edits target a single node via its dotted field (checklist.0.children.2)
+    rather than rewriting the whole tree.
+    """
     id: str = Field(..., description="Unique node id (uuid)")
     title: str = Field(..., description="Display title")
     kind: Literal["item", "folder"] = Field("item", description="Node type")